@@ -1,21 +1,21 @@
 import os
+import re
 import sys
 import logging
-import threading
 import argparse
-from typing import Dict, List, Optional
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from rich.console import Console
 from rich.table import Table
 from rich.prompt import Prompt, Confirm
-from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeRemainingColumn
 from rich.logging import RichHandler
 from dotenv import load_dotenv
 
-from file_processor import compile_project_files
-from smart_processor import SmartFileProcessor
+from file_processor import compile_project_files, MAX_WORKERS
+
+# Splits comma-separated answers, dropping the whitespace around each item
+CSV_SPLIT_RE = re.compile(r'\s*,\s*')
 
 # ASCII Banner
 ASCII_BANNER = r"""
@@ -31,6 +31,7 @@ class Project2TextCLI:
         self.console = Console()
         self.setup_logging()
         load_dotenv()
+        self._has_api_key = any(os.environ.get(key) for key in ('OPENAI_API_KEY', 'ANTHROPIC_API_KEY'))
         
         self.agents_available = {
             "code_analyzer": {
@@ -108,7 +109,12 @@ class Project2TextCLI:
             "no_metadata": False,
             "limit_size": 0,
             "smart_processing": False,
-            "llm_choice": "gpt3"
+            "llm_choice": "gpt3",
+            "prefetch": False,
+            "cache_file_list": False,
+            "follow_symlinks": False,
+            "use_processes": False,
+            "io_uring": False
         }
 
     def show_banner(self):
@@ -142,9 +148,8 @@ class Project2TextCLI:
         self.console.print(table)
 
     def check_api_keys(self) -> bool:
-        """Check if necessary API keys are present in .env"""
-        required_keys = ['OPENAI_API_KEY', 'ANTHROPIC_API_KEY']
-        return any(os.getenv(key) for key in required_keys)
+        """Check if necessary API keys are present in .env (looked up once at startup)"""
+        return self._has_api_key
 
     def prompt_for_api_key(self):
         """Prompt user for API key if not found in .env"""
@@ -158,10 +163,13 @@ class Project2TextCLI:
         if provider != "skip":
             api_key = Prompt.ask(f"Please enter your {provider.upper()} API key", password=True)
             os.environ[f'{provider.upper()}_API_KEY'] = api_key
+            self._has_api_key = bool(api_key)
             self.console.print("[green]API key set successfully![/green]")
 
     def show_agent_options(self):
         """Display available AI agents and their capabilities"""
+        from rich.panel import Panel
+
         self.console.print("\n[bold cyan]Available AI Agents[/bold cyan]")
 
         for agent_id, agent_info in self.agents_available.items():
@@ -223,6 +231,11 @@ class Project2TextCLI:
         # Smart processing configuration
         self.prompt_smart_processing()
 
+    @staticmethod
+    def _split_csv(value: str) -> list:
+        """Split a comma-separated answer into its non-empty items"""
+        return [item for item in CSV_SPLIT_RE.split(value.strip()) if item]
+
     def _prompt_advanced_options(self):
         """Prompt for advanced configuration options"""
         # File extensions
@@ -230,39 +243,39 @@ class Project2TextCLI:
             "File extensions to include (comma-separated, e.g., .py,.txt). Leave blank to include all.",
             default=""
         )
-        self.config["include_extensions"] = [ext.strip() for ext in include_extensions.split(",")] if include_extensions else []
+        self.config["include_extensions"] = self._split_csv(include_extensions)
 
         exclude_extensions = Prompt.ask(
             "File extensions to exclude (comma-separated, e.g., .exe,.dll). Leave blank to exclude none.",
             default=""
         )
-        self.config["exclude_extensions"] = [ext.strip() for ext in exclude_extensions.split(",")] if exclude_extensions else []
+        self.config["exclude_extensions"] = self._split_csv(exclude_extensions)
 
         # Directories and files
         exclude_dirs = Prompt.ask(
             "Directories to exclude (comma-separated)",
             default=",".join(self.config["exclude_dirs"])
         )
-        self.config["exclude_dirs"] = [d.strip() for d in exclude_dirs.split(",")]
+        self.config["exclude_dirs"] = self._split_csv(exclude_dirs)
 
         exclude_files = Prompt.ask(
             "Files to exclude (comma-separated). Leave blank to exclude none.",
             default=""
         )
-        self.config["exclude_files"] = [f.strip() for f in exclude_files.split(",")] if exclude_files else []
+        self.config["exclude_files"] = self._split_csv(exclude_files)
 
         # Patterns
         pattern_include = Prompt.ask(
             "Patterns to include (comma-separated, e.g., *.py,test_*.txt). Leave blank to include all.",
             default=""
         )
-        self.config["pattern_include"] = [p.strip() for p in pattern_include.split(",")] if pattern_include else []
+        self.config["pattern_include"] = self._split_csv(pattern_include)
 
         pattern_exclude = Prompt.ask(
             "Patterns to exclude (comma-separated, e.g., *.log,temp_*). Leave blank to exclude none.",
             default=""
         )
-        self.config["pattern_exclude"] = [p.strip() for p in pattern_exclude.split(",")] if pattern_exclude else []
+        self.config["pattern_exclude"] = self._split_csv(pattern_exclude)
 
         # Other options
         self.config["no_metadata"] = Confirm.ask(
@@ -286,38 +299,47 @@ class Project2TextCLI:
             console=self.console
         ) as progress:
             
-            # Regular processing
-            task_id = progress.add_task("Processing files...", total=100)
+            # Regular processing; the total is filled in once the files have been collected
+            task_id = progress.add_task("Processing files...", total=None)
             
-            compile_project_files(
-                dir_path=self.config["dir_path"],
-                output_filename=self.config["output_filename"],
-                output_format=self.config["output_format"],
-                include_extensions=self.config["include_extensions"],
-                exclude_extensions=self.config["exclude_extensions"],
-                exclude_dirs=self.config["exclude_dirs"],
-                exclude_files=self.config["exclude_files"],
-                pattern_include=self.config["pattern_include"],
-                pattern_exclude=self.config["pattern_exclude"],
-                ignore_patterns=self.config["ignore_patterns"],
-                start_marker=self.config["start_marker"],
-                end_marker=self.config["end_marker"],
-                no_metadata=self.config["no_metadata"],
-                limit_size=self.config["limit_size"],
-                console=self.console,
-                progress=progress,
-                task_id=task_id
-            )
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                compile_project_files(
+                    dir_path=self.config["dir_path"],
+                    output_filename=self.config["output_filename"],
+                    output_format=self.config["output_format"],
+                    include_extensions=self.config["include_extensions"],
+                    exclude_extensions=self.config["exclude_extensions"],
+                    exclude_dirs=self.config["exclude_dirs"],
+                    exclude_files=self.config["exclude_files"],
+                    pattern_include=self.config["pattern_include"],
+                    pattern_exclude=self.config["pattern_exclude"],
+                    ignore_patterns=self.config["ignore_patterns"],
+                    start_marker=self.config["start_marker"],
+                    end_marker=self.config["end_marker"],
+                    no_metadata=self.config["no_metadata"],
+                    limit_size=self.config["limit_size"],
+                    console=self.console,
+                    progress=progress,
+                    task_id=task_id,
+                    executor=executor,
+                    prefetch=self.config["prefetch"],
+                    cache_file_list=self.config["cache_file_list"],
+                    follow_symlinks=self.config["follow_symlinks"],
+                    use_processes=self.config["use_processes"],
+                    io_uring=self.config["io_uring"]
+                )
 
             # Smart processing if enabled
             if self.config["smart_processing"]:
+                from smart_processor import SmartFileProcessor
+
                 smart_task_id = progress.add_task("Running smart processing...", total=100)
                 
-                smart_output_dir = Path(self.config["output_filename"]).parent / "smart_processed"
+                smart_output_dir = os.path.join(os.path.dirname(self.config["output_filename"]) or ".", "smart_processed")
                 processor = SmartFileProcessor(
                     llm_name=self.config["llm_choice"],
                     codebase_path=self.config["dir_path"],
-                    output_dir=str(smart_output_dir)
+                    output_dir=smart_output_dir
                 )
                 
                 try:
@@ -342,6 +364,11 @@ class Project2TextCLI:
             parser.add_argument("-o", "--output", help="Output file name")
             parser.add_argument("-f", "--format", choices=["markdown", "html", "json"], help="Output format")
             parser.add_argument("--skip-wizard", action="store_true", help="Skip the setup wizard")
+            parser.add_argument("--prefetch", action="store_true", help="Read files ahead in batches (Linux)")
+            parser.add_argument("--cache", action="store_true", help="Reuse the file list from the last run if the project is unchanged")
+            parser.add_argument("--follow-symlinks", action="store_true", help="Follow symbolic links to files and directories")
+            parser.add_argument("--processes", action="store_true", help="Process files in one worker process per CPU")
+            parser.add_argument("--io-uring", action="store_true", help="Read files in batches through io_uring (Linux, needs liburing)")
             
             args = parser.parse_args()
 
@@ -356,6 +383,16 @@ class Project2TextCLI:
                 self.config["output_filename"] = args.output
             if args.format:
                 self.config["output_format"] = args.format
+            if args.prefetch:
+                self.config["prefetch"] = True
+            if args.cache:
+                self.config["cache_file_list"] = True
+            if args.follow_symlinks:
+                self.config["follow_symlinks"] = True
+            if args.processes:
+                self.config["use_processes"] = True
+            if args.io_uring:
+                self.config["io_uring"] = True
 
             # Check for API keys if smart processing is enabled
             if self.config["smart_processing"] and not self.check_api_keys():
@@ -1,6 +1,7 @@
 import os
 import sys
-import chardet
+import codecs
+import hashlib
 import logging
 import threading
 import time
@@ -8,13 +9,77 @@ import stat
 import json
 import html
 import fnmatch
-from concurrent.futures import ThreadPoolExecutor
+import re
+import queue
+import multiprocessing
+from functools import partial, lru_cache
+from itertools import islice
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 from rich.console import Console
 from rich.progress import Progress
 
-# Lock for writing to the output file
-write_lock = threading.Lock()
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import cchardet
+except ImportError:
+    cchardet = None
+
+# Upper bound on worker threads, and on how many files a single worker task handles
+MAX_WORKERS = min(32, (os.cpu_count() or 4) * 2)
+BATCH_SIZE = 64
+
+# Batches of formatted files waiting for the writer thread, and the output file buffer size
+WRITE_QUEUE_SIZE = 8
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Size of each worker thread's reusable read buffer, larger files are read normally
+READ_BUFFER_SIZE = 1 << 20
+read_buffers = threading.local()
+
+# Worker threads used to list directories for the tree when no executor is given
+TREE_WORKERS = 8
+
+# Bytes bytes.split() separates tokens on, plus b'' for the ends of empty payloads
+WHITESPACE_BYTES = frozenset([b'', b' ', b'\t', b'\n', b'\r', b'\x0b', b'\x0c'])
+
+# Minimum number of seconds between progress bar updates
+PROGRESS_INTERVAL = 0.05
+
+# Where file lists are cached between runs when caching is enabled
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'project2text')
+
+# Byte order marks and the codecs that decode them (UTF-32 first, its LE BOM starts like UTF-16's)
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# Whether os.path.normcase leaves names alone, as it does everywhere but Windows
+NORMCASE_IS_IDENTITY = os.path.normcase('A/B') == 'A/B'
+
+# Bytes of a file given to the encoding detector, which settles well before that,
+# and how much of it chardet is fed at a time
+DETECT_SAMPLE_SIZE = 64 * 1024
+DETECT_CHUNK_SIZE = 16 * 1024
+
+# Encodings already detected, keyed by a hash of the first DETECT_KEY_SIZE bytes
+DETECT_KEY_SIZE = 1024
+detected_encodings = {}
+
+# Bytes read from the start of each file to decide whether it is binary
+BINARY_CHECK_SIZE = 8192
+
+# BOMs of the encodings whose text contains NUL bytes (the UTF-32 LE BOM starts with UTF-16 LE's)
+WIDE_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE, codecs.BOM_UTF32_BE)
+
 def compile_project_files(
         dir_path,
         output_filename,
@@ -32,14 +97,35 @@ def compile_project_files(
         limit_size,
         progress,
         console: Console,
-        task_id=None  # Added task_id parameter with default None
+        task_id=None,  # Added task_id parameter with default None
+        executor=None,
+        prefetch=False,
+        cache_file_list=False,
+        follow_symlinks=False,
+        use_processes=False,
+        io_uring=False
     ):
-    """Compiles project files into a single text file based on provided arguments"""
+    """Compiles project files into a single text file based on provided arguments.
+
+    If no executor is given, a bounded ThreadPoolExecutor is created for the run.
+    With prefetch, each batch of files is read ahead by the kernel before processing.
+    With cache_file_list, the filtered file list is reused from the previous run with
+    the same filters as long as none of the scanned directories have changed.
+    Symbolic links are skipped unless follow_symlinks is set.
+    With use_processes, files are read and formatted in a pool of worker processes,
+    one per CPU, so encoding detection and escaping aren't serialized by the GIL.
+    With io_uring, each batch of files is read through a single io_uring submission
+    on Linux when the optional liburing package is installed.
+    """
 
     # Check if the provided directory exists
     if not os.path.isdir(dir_path):
         console.print(f"[red]The directory '{dir_path}' does not exist.[/red]")
         sys.exit(1)
+
+    if io_uring and not io_uring_available():
+        console.print("[yellow]io_uring is not available, reading files normally.[/yellow]")
+        io_uring = False
         
     # Validate and adjust file extension based on format
     extension_map = {
@@ -65,216 +151,804 @@ def compile_project_files(
         'Permissions': not no_metadata,
         'Owner': not no_metadata
     }
+    # Decided once here instead of filtering every file's metadata against the options;
+    # JSON records always carry the full metadata and HTML shows none, so only the
+    # fields that end up in the output are ever formatted
+    if output_format == 'json':
+        metadata_keys = tuple(METADATA_FIELDS)
+    elif output_format == 'html':
+        metadata_keys = ()
+    else:
+        metadata_keys = tuple(key for key, enabled in metadata_options.items() if enabled)
+    formatter = FORMATTERS.get(output_format, format_markdown)
+
+    # Hashed lookup for directory exclusions, checked once per directory entry
+    exclude_dirs = frozenset(exclude_dirs)
+
+    # Compile glob patterns once instead of re-translating them for every file,
+    # folding every file name filter into a single regex
+    is_ignored = compile_ignore_filter(ignore_patterns)
+    accept_re = compile_file_filter(exclude_files, include_extensions, exclude_extensions,
+                                    pattern_include, pattern_exclude)
+
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
     try:
-        # Generate the ASCII tree
-        tree = generate_tree(dir_path, ignore_patterns=ignore_patterns)
+        # List the project once, for both the ASCII tree and the files to process
+        listings = walk_project(dir_path, is_ignored, executor, follow_symlinks, stat_dirs=cache_file_list)
+        tree = build_tree(dir_path, listings, follow_symlinks)
 
         # Initialize file counter and state
-        file_counter = {'count': 1, 'first_file': True, 'tree': tree}
-
-        # Collect all files to process
-        file_list = []
-        for root, dirs, files in os.walk(dir_path):
-            # Apply ignore patterns to directories
-            dirs[:] = [d for d in dirs if not any(fnmatch.fnmatch(os.path.join(root, d), pattern) for pattern in ignore_patterns)]
-            # Exclude specific directories
-            dirs[:] = [d for d in dirs if d not in exclude_dirs]
-            # Apply ignore patterns to files
-            files = [f for f in files if not any(fnmatch.fnmatch(os.path.join(root, f), pattern) for pattern in ignore_patterns)]
-            for file in files:
-                if file in exclude_files:
-                    continue
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, dir_path)
+        file_counter = {'count': 1, 'first_file': True, 'tree': tree, 'sizes': {}, 'tokens': {}}
 
-                # Skip files based on extensions
-                if include_extensions and not any(file.endswith(ext) for ext in include_extensions):
-                    continue
-                if exclude_extensions and any(file.endswith(ext) for ext in exclude_extensions):
-                    continue
+        # Workers hand formatted content to a single writer thread through this queue
+        write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
 
-                # Skip files based on patterns
-                if pattern_include and not any(fnmatch.fnmatch(file, pat) for pat in pattern_include):
-                    continue
-                if pattern_exclude and any(fnmatch.fnmatch(file, pat) for pat in pattern_exclude):
+        # Collect all files to process, reusing the cached list when nothing changed
+        project_files = None
+        if cache_file_list:
+            cache_path = file_list_cache_path(dir_path, (
+                exclude_dirs, exclude_files, include_extensions, exclude_extensions,
+                pattern_include, pattern_exclude, ignore_patterns
+            ), follow_symlinks)
+            project_files = load_cached_file_list(cache_path, listings)
+
+        if project_files is None:
+            scanned_dirs = {} if cache_file_list else None
+            scanned_files = [] if cache_file_list else None
+            project_files = []
+            for entry, relative_path in iter_project_files(dir_path, listings, exclude_dirs, follow_symlinks,
+                                                           scanned_dirs):
+                # Skip files based on names, extensions and patterns
+                if accept_re is not None and accept_re.match(entry.name) is None:
                     continue
 
-                # Skip binary files
-                if is_binary(file_path):
+                # Skip binary files, the cache keeps them to notice if they turn into text
+                binary = is_binary(entry.path)
+                if scanned_files is not None:
+                    scanned_files.append((entry.path, relative_path, entry.stat(), binary))
+                if binary:
                     continue
 
-                file_list.append((file_path, relative_path, output_format, markers, metadata_options, output_filename, limit_size, file_counter))
+                # DirEntry caches its stat result, so process_file doesn't need to stat again
+                project_files.append((entry.path, relative_path, entry.stat()))
+
+            if cache_file_list:
+                save_cached_file_list(cache_path, scanned_dirs, scanned_files)
+
+        # Settings shared by every file are bound once, so batches only carry
+        # each file's (file_path, relative_path, stats)
+        format_one = partial(format_file, formatter, markers, metadata_keys)
+
+        # Now that the real number of files is known, use it as the progress total
+        total_files = len(project_files)
+        if task_id is not None:
+            progress.update(task_id, total=total_files)
+
+        # Dispatch files in batches so each task handles many files, keeping
+        # enough batches around to spread the work over every worker
+        workers = (os.cpu_count() or 1) if use_processes else MAX_WORKERS
+        batch_size = max(1, min(BATCH_SIZE, total_files // (workers * 4)))
+        batches = [project_files[i:i + batch_size] for i in range(0, total_files, batch_size)]
+
+        # Workers start from a fresh interpreter; forking this process would copy it
+        # mid-run, with the writer, progress and executor threads' locks possibly held
+        process_pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=worker_process_context()
+        ) if use_processes else None
 
-        # Initialize counters for progress tracking
-        total_files = len(file_list)
-        files_processed = 0  # Added initialization of files_processed
+        writer = threading.Thread(
+            target=write_output,
+            args=(write_queue, output_filename, output_format, markers, limit_size, file_counter),
+            daemon=True
+        )
+        writer.start()
 
         # Process files with multi-threading and a progress bar
-        with ThreadPoolExecutor() as executor:
-            for _ in executor.map(process_file_wrapper, file_list):
-                files_processed += 1
-                if task_id is not None:
-                    # Update progress based on percentage of files processed
-                    progress.update(task_id, completed=(files_processed / total_files) * 100)
+        in_flight = deque()
+        try:
+            # Every update takes the Progress lock and records a speed sample for the task,
+            # so batches are reported at most every PROGRESS_INTERVAL
+            pending = 0
+            last_update = time.monotonic()
+            if process_pool is not None:
+                pool = process_pool
+                task = partial(format_file_batch, format_one=format_one, prefetch=prefetch, io_uring=io_uring)
+            else:
+                pool = executor
+                task = partial(process_file_batch, format_one=format_one, write_queue=write_queue,
+                               prefetch=prefetch, io_uring=io_uring)
+            # Only a window of batches is submitted at a time, the next one as each
+            # completes, so results can't pile up ahead of the bounded write queue
+            pending_batches = iter(batches)
+            in_flight.extend(pool.submit(task, batch) for batch in islice(pending_batches, workers * 2))
+            while in_flight:
+                batch_result = in_flight.popleft().result()
+                in_flight.extend(pool.submit(task, batch) for batch in islice(pending_batches, 1))
+                if process_pool is not None:
+                    # Worker processes can't reach the queue, so their output is queued here
+                    write_queue.put(batch_result)
+                    batch_result = len(batch_result)
+                pending += batch_result
+                now = time.monotonic()
+                if task_id is not None and now - last_update >= PROGRESS_INTERVAL:
+                    progress.update(task_id, advance=pending)
+                    pending = 0
+                    last_update = now
+            if task_id is not None and pending:
+                progress.update(task_id, advance=pending)
+        finally:
+            # After an error, batches that haven't started are dropped and running ones
+            # finish, so no worker is still queueing output once the writer stops
+            for future in in_flight:
+                future.cancel()
+            wait(in_flight)
+            if process_pool is not None:
+                process_pool.shutdown()
+            # Signal the writer that no more content is coming
+            write_queue.put(None)
+            writer.join()
 
-        # Get the list of output files generated
-        output_files = [f"{os.path.splitext(output_filename)[0]}_{i}{os.path.splitext(output_filename)[1]}" for i in range(1, file_counter['count'] + 1)]
+        if 'error' in file_counter:
+            raise file_counter['error']
 
-        # Calculate the total size and tokens
+        # Calculate the total size and tokens, both already counted by the writer
         total_size = 0
         total_tokens = 0
-        for output_file in output_files:
-            if os.path.exists(output_file):
-                size = os.path.getsize(output_file)
-                tokens = count_tokens_in_file(output_file)
-                total_size += size
-                total_tokens += tokens
-                console.print(f"Generated '{output_file}' - Size: {size} bytes, Tokens: {tokens}")
-
-        console.print(f"Total output size: {total_size} bytes")
-        console.print(f"Total number of tokens in output files: {total_tokens}")
+        summary_lines = []
+        for output_file, size in file_counter['sizes'].items():
+            tokens = file_counter['tokens'][output_file]
+            total_size += size
+            total_tokens += tokens
+            summary_lines.append(f"Generated '{output_file}' - Size: {size} bytes, Tokens: {tokens}")
+
+        summary_lines.append(f"Total output size: {total_size} bytes")
+        summary_lines.append(f"Total number of tokens in output files: {total_tokens}")
+        # Printed at once, every print redraws the live progress display
+        console.print('\n'.join(summary_lines))
     except Exception as e:
         logging.error(f"An error occurred: {e}")
         console.print("[red]An error occurred during processing. Please check the log file for details.[/red]")
+    finally:
+        if owns_executor:
+            executor.shutdown()
+
+def worker_process_context():
+    """Picks forkserver where the platform has it, spawn otherwise, never a plain fork."""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+def compile_patterns(patterns):
+    """Compiles a list of glob patterns into a single regex, or None if there are no patterns."""
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(os.path.normcase(pattern)) for pattern in patterns))
+
+def compile_ignore_filter(patterns):
+    """Builds the check for ignore patterns, called with an entry's path and name, or None.
+
+    Patterns are matched against whole paths, but one that is '*' followed by a plain
+    name suffix, such as '*.pyc' or '*__pycache__', matches a path exactly when it
+    matches the path's base name. Those are decided per base name and memoized, since
+    the same names turn up all over a tree; the rest are matched against the path.
+    """
+    if not patterns:
+        return None
+    name_patterns = [pattern for pattern in patterns if is_name_suffix_pattern(pattern)]
+    path_re = compile_patterns([pattern for pattern in patterns if not is_name_suffix_pattern(pattern)])
+    name_re = compile_patterns(name_patterns)
+
+    @lru_cache(maxsize=8192)
+    def name_ignored(name):
+        return matches_pattern(name_re, name)
+
+    def is_ignored(path, name):
+        return (name_re is not None and name_ignored(name)) or matches_pattern(path_re, path)
+    return is_ignored
+
+def is_name_suffix_pattern(pattern):
+    """Checks whether a glob pattern is '*' followed by text with no wildcards or separators."""
+    rest = pattern[1:]
+    return (pattern[:1] == '*' and not any(char in rest for char in '*?[/')
+            and os.sep not in rest and (os.altsep is None or os.altsep not in rest))
+
+def compile_file_filter(exclude_files, include_extensions, exclude_extensions, pattern_include, pattern_exclude):
+    """Compiles every file name filter into one regex that matches only accepted names.
+
+    Exclusions become negative lookaheads and inclusions positive ones, so a name is
+    checked in a single match call. Returns None when there is nothing to filter.
+    """
+    def alternation(parts):
+        # Repeated entries would only add branches to try, so keep the first of each
+        return '(?:' + '|'.join(dict.fromkeys(parts)) + ')'
+
+    def glob_alternation(patterns):
+        globs = alternation(fnmatch.translate(os.path.normcase(pattern)) for pattern in patterns)
+        # Patterns follow fnmatch's case rules, like matches_pattern
+        return globs if NORMCASE_IS_IDENTITY else '(?i:' + globs + ')'
+
+    conditions = []
+    if exclude_files:
+        conditions.append('(?!' + alternation(re.escape(name) for name in exclude_files) + r'\Z)')
+    if exclude_extensions:
+        conditions.append('(?!.*' + alternation(re.escape(ext) for ext in exclude_extensions) + r'\Z)')
+    if pattern_exclude:
+        conditions.append('(?!' + glob_alternation(pattern_exclude) + ')')
+    if include_extensions:
+        conditions.append('(?=.*' + alternation(re.escape(ext) for ext in include_extensions) + r'\Z)')
+    if pattern_include:
+        conditions.append('(?=' + glob_alternation(pattern_include) + ')')
+    if not conditions:
+        return None
+    return re.compile(''.join(conditions), re.DOTALL)
+
+def matches_pattern(pattern_re, name):
+    """Checks a name against a regex built by compile_patterns, with fnmatch's case rules."""
+    if pattern_re is None:
+        return False
+    if not NORMCASE_IS_IDENTITY:
+        name = os.path.normcase(name)
+    return pattern_re.match(name) is not None
 
-def generate_tree(dir_path, ignore_patterns=None):
+def file_list_cache_path(dir_path, filters, follow_symlinks):
+    """Returns the cache file for a directory scanned with the given filters."""
+    key = repr((os.path.abspath(dir_path), [sorted(f) for f in filters], follow_symlinks))
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(CACHE_DIR, f'{digest}.json')
+
+def load_cached_file_list(cache_path, listings):
+    """Loads a cached file list, or returns None if it is missing or any directory changed.
+
+    Adding, removing or renaming an entry updates its directory's mtime, so unchanged
+    mtimes mean the same files would be found again. The mtimes are compared with the
+    directory stats taken while listing the project, so no directory is stat'ed twice.
+    Rewriting a file in place leaves its directory's mtime alone, so files whose size
+    or mtime changed are checked for binary content again, whether they were binary
+    or text when cached.
+    """
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            data = cache_file.read()
+        cached = orjson.loads(data) if orjson is not None else json.loads(data)
+        for directory, mtime_ns in cached['dirs'].items():
+            listing = listings.get(directory)
+            if listing is None or listing[0] is None or listing[0].st_mtime_ns != mtime_ns:
+                return None
+        project_files = []
+        for file_path, relative_path, size, mtime_ns, binary in cached['files']:
+            file_stat = os.stat(file_path)
+            if file_stat.st_size != size or file_stat.st_mtime_ns != mtime_ns:
+                binary = is_binary(file_path)
+            if not binary:
+                project_files.append((file_path, relative_path, file_stat))
+        return project_files
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def save_cached_file_list(cache_path, scanned_dirs, scanned_files):
+    """Saves the scanned directory mtimes and the filtered files for the next run.
+
+    scanned_files holds (file_path, relative_path, stats, binary) for every file that
+    passed the filters, so the size and mtime of each, binary or not, are kept.
+    """
+    cached = {
+        'dirs': scanned_dirs,
+        'files': [
+            (file_path, relative_path, file_stat.st_size, file_stat.st_mtime_ns, binary)
+            for file_path, relative_path, file_stat, binary in scanned_files
+        ]
+    }
+    try:
+        # orjson refuses names that aren't valid UTF-8, which json escapes instead
+        data = orjson.dumps(cached) if orjson is not None else None
+    except TypeError:
+        data = None
+    if data is None:
+        data = json.dumps(cached).encode('utf-8')
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, 'wb') as cache_file:
+            cache_file.write(data)
+    except OSError as e:
+        logging.error(f'Error saving file list cache {cache_path}: {e}')
+
+def generate_tree(dir_path, ignore_patterns=None, executor=None):
     """Generates an ASCII tree representation of the directory structure."""
-    ignore_patterns = ignore_patterns or []
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ThreadPoolExecutor(max_workers=TREE_WORKERS)
+    try:
+        listings = walk_project(dir_path, compile_ignore_filter(ignore_patterns), executor)
+    finally:
+        if owns_executor:
+            executor.shutdown()
+    return build_tree(dir_path, listings)
+
+def walk_project(dir_path, is_ignored, executor, follow_symlinks=False, stat_dirs=False):
+    """Lists every directory of the project once, concurrently on the executor.
+
+    Each finished listing submits its subdirectories, so directory reads overlap.
+    Returns {path: (dir_stat, subdirs, files)}, with DirEntry lists that leave out
+    ignored entries; dir_stat is only taken with follow_symlinks or stat_dirs.
+    Linked directories are listed only with follow_symlinks, and never when they
+    lead back to one of their own ancestors.
+    """
+    listings = {}
+    stat_dirs = stat_dirs or follow_symlinks
+    pending = {executor.submit(list_dir, dir_path, is_ignored, stat_dirs): (dir_path, frozenset())}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            path, ancestors = pending.pop(future)
+            listings[path] = dir_stat, subdirs, _ = future.result()
+            if follow_symlinks and dir_stat is not None:
+                ancestors = ancestors | {(dir_stat.st_dev, dir_stat.st_ino)}
+            for entry in subdirs:
+                if entry.is_symlink():
+                    if not follow_symlinks:
+                        continue
+                    try:
+                        target = entry.stat()
+                    except OSError:
+                        continue
+                    if (target.st_dev, target.st_ino) in ancestors:
+                        continue
+                pending[executor.submit(list_dir, entry.path, is_ignored, stat_dirs)] = (entry.path, ancestors)
+    return listings
+
+def list_dir(dir_path, is_ignored, stat_dir=False):
+    """Lists a directory with os.scandir, returning (dir_stat, subdirs, files).
+
+    Entry types come from the directory listing itself, so no extra stat() is
+    issued per entry. Like os.walk, anything that isn't a directory counts as a file.
+    """
+    dir_stat = None
+    subdirs = []
+    files = []
+    try:
+        if stat_dir:
+            # Taken before listing, so a change made during the scan invalidates the cache
+            dir_stat = os.stat(dir_path)
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                # Apply ignore patterns to directories and files
+                if is_ignored is not None and is_ignored(entry.path, entry.name):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    subdirs.append(entry)
+                else:
+                    files.append(entry)
+    except OSError as e:
+        logging.error(f'Error scanning directory {dir_path}: {e}')
+    return dir_stat, subdirs, files
+
+def build_tree(dir_path, listings, follow_symlinks=False):
+    """Assembles the ASCII tree from the listings, depth first in os.walk's order.
+
+    Linked directories are shown like os.walk does, only with follow_symlinks, and
+    only those walk_project listed, so the tree matches the files processed.
+    """
     tree_lines = []
-    for root, dirs, files in os.walk(dir_path):
-        # Apply ignore patterns to directories
-        dirs[:] = [d for d in dirs if not any(fnmatch.fnmatch(os.path.join(root, d), pattern) for pattern in ignore_patterns)]
-        level = root.replace(dir_path, '').count(os.sep)
-        indent = '    ' * level
+    # The depth comes from the traversal and names from the entries, so no path is
+    # taken apart; normpath keeps a trailing separator from emptying the root's name
+    stack = [(dir_path, os.path.basename(os.path.normpath(dir_path)), 0)]
+    while stack:
+        path, name, level = stack.pop()
+        _, subdirs, files = listings[path]
         sub_indent = '    ' * (level + 1)
-        tree_lines.append(f'{indent}{os.path.basename(root)}/')
-        # Apply ignore patterns to files
-        files = [f for f in files if not any(fnmatch.fnmatch(os.path.join(root, f), pattern) for pattern in ignore_patterns)]
-        for f in files:
-            tree_lines.append(f'{sub_indent}{f}')
+        tree_lines.append(f"{'    ' * level}{name}/")
+        tree_lines.extend(sub_indent + entry.name for entry in files)
+        stack.extend(
+            (entry.path, entry.name, level + 1)
+            for entry in reversed(subdirs)
+            if entry.path in listings and (follow_symlinks or not entry.is_symlink())
+        )
     return tree_lines
 
+def iter_project_files(dir_path, listings, exclude_dirs, follow_symlinks=False, scanned_dirs=None):
+    """Yields (entry, relative_path) for each project file in the listings, depth first.
+
+    Excluded directories are pruned, and symbolic links are skipped without touching
+    their targets unless follow_symlinks is set, in which case a directory reached
+    through several links is only visited once.
+    If scanned_dirs is given, it is filled with the mtime of every directory visited.
+    """
+    visited_dirs = set()
+    # Relative paths are built by concatenating onto each directory's prefix,
+    # which is much cheaper than an os.path.join call per entry
+    stack = [(dir_path, '')]
+    while stack:
+        path, relative_prefix = stack.pop()
+        dir_stat, subdirs, files = listings[path]
+        if dir_stat is None and (follow_symlinks or scanned_dirs is not None):
+            # The directory couldn't be read
+            continue
+        if follow_symlinks:
+            if (dir_stat.st_dev, dir_stat.st_ino) in visited_dirs:
+                continue
+            visited_dirs.add((dir_stat.st_dev, dir_stat.st_ino))
+        if scanned_dirs is not None:
+            scanned_dirs[path] = dir_stat.st_mtime_ns
+        for entry in files:
+            if entry.is_file(follow_symlinks=follow_symlinks):
+                yield entry, relative_prefix + entry.name
+        stack.extend(
+            (entry.path, relative_prefix + entry.name + os.sep)
+            for entry in reversed(subdirs)
+            if entry.name not in exclude_dirs and entry.path in listings
+            and (follow_symlinks or not entry.is_symlink())
+        )
+
 def is_binary(file_path):
-    """Determines if a file is binary."""
+    """Determines if a file is binary.
+
+    Text rarely contains NUL bytes, so a file without any in its first BINARY_CHECK_SIZE
+    bytes is text. UTF-16 and UTF-32 text does contain them, so files starting with
+    one of their BOMs are still checked with chardet.
+    """
     try:
-        with open(file_path, 'rb') as f:
-            initial_bytes = f.read(1024)
-        result = chardet.detect(initial_bytes)
+        # A bare descriptor read, the check doesn't need a buffered file object
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            initial_bytes = os.read(fd, BINARY_CHECK_SIZE)
+        finally:
+            os.close(fd)
+        if b'\x00' not in initial_bytes:
+            return False
+        if not initial_bytes.startswith(WIDE_BOMS):
+            return True
+        import chardet  # Imported on first use, it is slow to load
+        result = chardet.detect(initial_bytes[:1024])
         return result['encoding'] is None
     except Exception as e:
         logging.error(f'Error detecting if file is binary {file_path}: {e}')
         return True
 
-def read_file_content(file_path):
-    """Reads the content of a file, handling encoding issues."""
+def read_file_content(file_path, size=0):
+    """Reads the content of a file, handling encoding issues.
+
+    Files up to READ_BUFFER_SIZE are read into a buffer owned by the current thread
+    and decoded straight from it, so no bytes object is allocated per file. The file is
+    opened unbuffered, since a read buffer of its own would only add a copy.
+    """
     try:
-        with open(file_path, 'rb') as f:
-            raw_data = f.read()
-            result = chardet.detect(raw_data)
-            encoding = result['encoding'] or 'utf-8'
-            content = raw_data.decode(encoding, errors='replace')
-            return content
+        with open(file_path, 'rb', buffering=0) as f:
+            if size >= READ_BUFFER_SIZE:
+                return decode_content(f.read())
+            buffer = getattr(read_buffers, 'buffer', None)
+            if buffer is None:
+                buffer = read_buffers.buffer = bytearray(READ_BUFFER_SIZE)
+            with memoryview(buffer) as view:
+                # An unbuffered read may return less than asked for before the end of
+                # the file (network filesystems, signals), so read until it returns nothing
+                n = 0
+                while n < READ_BUFFER_SIZE:
+                    read = f.readinto(view[n:])
+                    if not read:
+                        break
+                    n += read
+                if n == READ_BUFFER_SIZE:
+                    # The file grew past the buffer since it was stat'ed
+                    return decode_content(bytes(buffer) + f.read())
+                return decode_content(view[:n])
     except Exception as e:
         logging.error(f'Error reading {file_path}: {e}')
         return f'Could not read file: {e}'
 
-def process_file_wrapper(args):
-    """Wrapper function for processing files in the thread pool"""
-    process_file(*args)
-
-def process_file(file_path, relative_path, output_format, markers, metadata_options,
-                 output_file_path, limit_size, file_counter):
-    """Processes a single file and writes its content to the output."""
-    content = read_file_content(file_path)
-
-    # Get file metadata
-    stats = os.stat(file_path)
-    size = stats.st_size
-    mtime = time.ctime(stats.st_mtime)
-    ctime = time.ctime(stats.st_ctime)
-    permissions = stat.filemode(stats.st_mode)
-    owner = stats.st_uid  # Note: On Windows, this may not be accurate
-
-    metadata = {
-        'File Size': f'{size} bytes',
-        'Last Modified': mtime,
-        'Creation Time': ctime,
-        'Permissions': permissions,
-        'Owner': owner
-    }
+def decode_content(raw_data):
+    """Decodes file data, only detecting the encoding when it has no BOM and isn't valid UTF-8.
+
+    raw_data may be bytes or a memoryview.
+    """
+    head = bytes(raw_data[:4])
+    for bom, encoding in BOM_ENCODINGS:
+        if head.startswith(bom):
+            return str(raw_data, encoding, 'replace')
+    try:
+        return str(raw_data, 'utf-8')
+    except UnicodeDecodeError:
+        pass
+    # Files sharing a prefix, such as a license header, usually share an encoding too,
+    # so a previous detection is reused whenever it decodes the data cleanly
+    key = hashlib.blake2b(raw_data[:DETECT_KEY_SIZE], digest_size=8).digest()
+    encoding = detected_encodings.get(key)
+    if encoding is not None:
+        try:
+            return str(raw_data, encoding)
+        except UnicodeDecodeError:
+            pass
+    encoding = detect_encoding(raw_data)
+    try:
+        content = str(raw_data, encoding, 'replace')
+    except LookupError:
+        # The detector named a codec Python doesn't know
+        return str(raw_data, 'utf-8', 'replace')
+    detected_encodings[key] = encoding
+    return content
 
-    # Filter metadata based on options
-    metadata_str = '\n'.join([f'{key}: {value}' for key, value in metadata.items() if metadata_options.get(key, True)])
+def detect_encoding(raw_data):
+    """Guesses the encoding of file data from its first DETECT_SAMPLE_SIZE bytes.
 
-    # Prepare content based on output format
-    if output_format == 'markdown':
-        file_content = f'\n{markers["start"]} {relative_path} {markers["start"]}\n{metadata_str}\n\n{content}\n{markers["end"]} {relative_path} {markers["end"]}\n'
-    elif output_format == 'html':
-        safe_content = html.escape(content)
-        file_content = f'<h2>{relative_path}</h2>\n<pre>\n{safe_content}\n</pre>\n'
-    elif output_format == 'json':
-        file_content = json.dumps({
-            'file': relative_path,
-            'metadata': metadata,
-            'content': content
-        }, ensure_ascii=False) + '\n'
+    Uses cchardet when it is installed. Otherwise chardet's UniversalDetector is fed
+    DETECT_CHUNK_SIZE bytes at a time and stops as soon as it is confident.
+    """
+    if cchardet is not None:
+        return cchardet.detect(bytes(raw_data[:DETECT_SAMPLE_SIZE]))['encoding'] or 'utf-8'
+    from chardet import UniversalDetector  # Imported on first use, it is slow to load
+    detector = UniversalDetector()
+    for start in range(0, min(len(raw_data), DETECT_SAMPLE_SIZE), DETECT_CHUNK_SIZE):
+        detector.feed(bytes(raw_data[start:start + DETECT_CHUNK_SIZE]))
+        if detector.done:
+            break
+    return detector.close()['encoding'] or 'utf-8'
+
+def prefetch_files(file_paths):
+    """Asks the kernel to start reading a batch of files before they are processed.
+
+    posix_fadvise(WILLNEED) queues the reads for the whole batch at once so they are
+    served from the page cache afterwards. Does nothing where it isn't available.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for file_path in file_paths:
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+def io_uring_available():
+    """Checks that liburing is installed and the kernel lets us set up a ring."""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        from liburing import Ring, io_uring_queue_init, io_uring_queue_exit
+        ring = Ring()
+        io_uring_queue_init(1, ring)
+        io_uring_queue_exit(ring)
+        return True
+    except Exception as e:
+        logging.error(f'io_uring is not available: {e}')
+        return False
+
+def read_files_io_uring(batch):
+    """Reads every file of a batch through one io_uring submission.
+
+    Returns the data of each file, or None for files that couldn't be read this way
+    (including files that grew since they were stat'ed), which are then read normally.
+    """
+    from liburing import (  # Optional, only needed with io_uring
+        Ring, Cqe, io_uring_queue_init, io_uring_queue_exit, io_uring_get_sqe, io_uring_prep_read,
+        io_uring_sqe_set_data64, io_uring_submit_and_wait, io_uring_wait_cqe, io_uring_cq_ready,
+        io_uring_cq_advance
+    )
+    results = [None] * len(batch)
+    buffers = {}
+    fds = []
+    ring = Ring()
+    cqe = Cqe()
+    io_uring_queue_init(len(batch), ring)
+    try:
+        for index, args in enumerate(batch):
+            try:
+                fd = os.open(args[0], os.O_RDONLY)
+            except OSError:
+                continue
+            fds.append(fd)
+            # One spare byte shows whether the file grew
+            buffers[index] = bytearray(args[2].st_size + 1)
+            sqe = io_uring_get_sqe(ring)
+            io_uring_prep_read(sqe, fd, buffers[index], 0)
+            io_uring_sqe_set_data64(sqe, index)
+        if buffers:
+            io_uring_submit_and_wait(ring, len(buffers))
+        completed = 0
+        while completed < len(buffers):
+            io_uring_wait_cqe(ring, cqe)
+            ready = io_uring_cq_ready(ring)
+            for i in range(ready):
+                index = cqe[i].user_data
+                size = cqe[i].res
+                if 0 <= size < len(buffers[index]):
+                    results[index] = memoryview(buffers[index])[:size]
+            io_uring_cq_advance(ring, ready)
+            completed += ready
+    finally:
+        for fd in fds:
+            os.close(fd)
+        io_uring_queue_exit(ring)
+    return results
+
+def process_file_batch(batch, format_one, write_queue, prefetch=False, io_uring=False):
+    """Processes a batch of files within a single thread pool task, returning the batch size
+
+    Each file is formatted with format_one, format_file with the run's settings bound,
+    and the batch is queued for the writer thread as a whole, one queue operation per batch.
+    """
+    if prefetch:
+        prefetch_files([args[0] for args in batch])
+    raw_data = read_files_io_uring(batch) if io_uring else [None] * len(batch)
+    write_queue.put([format_one(*args, data) for args, data in zip(batch, raw_data)])
+    return len(batch)
+
+def format_file_batch(batch, format_one, prefetch=False, io_uring=False):
+    """Formats a batch of files within a single process pool task, returning their contents"""
+    if prefetch:
+        prefetch_files([args[0] for args in batch])
+    raw_data = read_files_io_uring(batch) if io_uring else [None] * len(batch)
+    return [format_one(*args, data) for args, data in zip(batch, raw_data)]
+
+def format_file(formatter, markers, metadata_keys, file_path, relative_path, stats, raw_data=None):
+    """Formats a single file for the output with the run's formatter, returning UTF-8 encoded bytes.
+
+    The file is read here unless its data was already read into raw_data.
+    """
+    if raw_data is not None:
+        content = decode_content(raw_data)
     else:
-        file_content = f'\n{markers["start"]} {relative_path} {markers["start"]}\n{metadata_str}\n\n{content}\n{markers["end"]} {relative_path} {markers["end"]}\n'
+        content = read_file_content(file_path, stats.st_size)
+
+    # Get the file metadata fields this run outputs
+    metadata = {key: METADATA_FIELDS[key](stats) for key in metadata_keys}
+
+    return formatter(relative_path, content, metadata, markers)
+
+# How each metadata field is formatted from the file's stat result
+METADATA_FIELDS = {
+    'File Size': lambda stats: f'{stats.st_size} bytes',
+    'Last Modified': lambda stats: time.ctime(stats.st_mtime),
+    'Creation Time': lambda stats: time.ctime(stats.st_ctime),
+    'Permissions': lambda stats: stat.filemode(stats.st_mode),
+    'Owner': lambda stats: stats.st_uid  # Note: On Windows, this may not be accurate
+}
+
+def format_markdown(relative_path, content, metadata, markers):
+    """Formats a file between its start and end markers, used for markdown and any unknown format."""
+    metadata_str = '\n'.join([f'{key}: {value}' for key, value in metadata.items()])
+    file_content = f'\n{markers["start"]} {relative_path} {markers["start"]}\n{metadata_str}\n\n{content}\n{markers["end"]} {relative_path} {markers["end"]}\n'
+    # File names that aren't valid UTF-8 are written back as their original bytes
+    return file_content.encode('utf-8', 'surrogateescape')
+
+def format_html(relative_path, content, metadata, markers):
+    """Formats a file as an html heading and preformatted block."""
+    # html.escape's str.replace passes copy nothing when there is nothing to escape
+    # and are far faster than a str.translate table when there is; sniffing for
+    # special characters first only adds a slower regex scan
+    safe_content = html.escape(content)
+    return f'<h2>{relative_path}</h2>\n<pre>\n{safe_content}\n</pre>\n'.encode('utf-8', 'surrogateescape')
 
-    # Write to the output file with thread safety
-    with write_lock:
+def format_json(relative_path, content, metadata, markers):
+    """Formats a file as a JSON line, serialized straight to UTF-8 bytes."""
+    return dumps_json_line({
+        'file': relative_path,
+        'metadata': metadata,
+        'content': content
+    })
+
+# Formatter for each output format, picked once per run
+FORMATTERS = {
+    'markdown': format_markdown,
+    'html': format_html,
+    'json': format_json
+}
+
+def dumps_json_line(data):
+    """Serializes data as a UTF-8 encoded JSON line, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            # orjson writes the newline itself, sparing a copy of the whole line
+            return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass
+    try:
+        return (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+    except UnicodeEncodeError:
+        # File names that aren't valid UTF-8 can't be written as is, json escapes them instead
+        return (json.dumps(data) + '\n').encode('utf-8')
+
+def write_output(write_queue, output_file_path, output_format, markers, limit_size, file_counter):
+    """Drains batches of formatted file contents from the queue into the output files.
+
+    Runs on a single writer thread that owns the open output file, so workers never
+    contend for it. A new output file is started whenever adding a file would exceed
+    limit_size; a file that doesn't fit even on its own gets an output file to itself.
+    None on the queue marks the end of the input.
+    Each output file's size and whitespace-separated token count are recorded in
+    file_counter as it is written, so the files never need to be read back.
+    """
+    base_name, extension = os.path.splitext(output_file_path)
+    output_file = None
+    plain_header = None
+    try:
         while True:
-            current_output_file = f"{os.path.splitext(output_file_path)[0]}_{file_counter['count']}{os.path.splitext(output_file_path)[1]}"
-            try:
-                if not os.path.exists(current_output_file):
-                    # If file doesn't exist, write the explanation and tree
-                    write_explanation(current_output_file, output_format=output_format, markers=markers)
+            payloads = write_queue.get()
+            if payloads is None:
+                break
+
+            for payload in payloads:
+                # Move to the next output file if this one is full
+                if output_file is not None and limit_size and current_size + len(payload) > limit_size:
+                    output_file.close()
+                    output_file = None
+                    file_counter['sizes'][current_output_file] = current_size
+                    file_counter['tokens'][current_output_file] = current_tokens
+                    file_counter['count'] += 1
+
+                if output_file is None:
+                    current_output_file = f"{base_name}_{file_counter['count']}{extension}"
+                    # Only write the tree to the first file, every later file starts
+                    # with the same header, which is built once
                     if file_counter['first_file']:
-                        # Only write the tree to the first file
-                        write_tree_to_output(current_output_file, file_counter['tree'], output_format)
                         file_counter['first_file'] = False
-                current_size = os.path.getsize(current_output_file)
-            except FileNotFoundError:
-                current_size = 0
-
-            # Check if adding the new content exceeds the limit
-            if limit_size and (current_size + len(file_content.encode('utf-8')) > limit_size):
-                # Move to the next file
-                file_counter['count'] += 1
-                continue  # Re-check with the new file
-            else:
-                with open(current_output_file, 'a', encoding='utf-8') as output_file:
-                    output_file.write(file_content)
-                break  # Content written, exit the loop
+                        header = format_header(output_format, markers, file_counter['tree'])
+                    else:
+                        if plain_header is None:
+                            plain_header = format_header(output_format, markers)
+                        header = plain_header
+                    output_file = open(current_output_file, 'wb', buffering=WRITE_BUFFER_SIZE)
+                    output_file.write(header)
+                    current_size = len(header)
+                    current_tokens = len(header.split())
+                    ends_in_token = header[-1:] not in WHITESPACE_BYTES
 
-def write_tree_to_output(output_file_path, tree, output_format):
-    """Writes the ASCII tree to the output file."""
+                output_file.write(payload)
+                current_size += len(payload)
+                # bytes.split counts tokens without decoding; a token running across the
+                # previous payload into this one was already counted
+                current_tokens += len(payload.split())
+                if ends_in_token and payload[:1] not in WHITESPACE_BYTES:
+                    current_tokens -= 1
+                ends_in_token = payload[-1:] not in WHITESPACE_BYTES
+    except Exception as e:
+        logging.error(f'Error writing output file: {e}')
+        file_counter['error'] = e
+        # Keep draining so workers blocked on a full queue can finish
+        while write_queue.get() is not None:
+            pass
+    finally:
+        if output_file is not None:
+            output_file.close()
+            file_counter['sizes'][current_output_file] = current_size
+            file_counter['tokens'][current_output_file] = current_tokens
+
+def format_header(output_format, markers, tree=None):
+    """Builds the start of an output file, the explanation and optionally the tree, as UTF-8 bytes."""
+    explanation = format_explanation(output_format, markers)
+    if output_format == 'json':
+        # JSON Lines, the explanation and the tree are each a line of their own
+        header = dumps_json_line(explanation)
+        if tree is not None:
+            header += dumps_json_line({'ascii_tree': tree})
+        return header
+    if tree is not None:
+        explanation += format_tree(tree, output_format)
+    return explanation.encode('utf-8', 'surrogateescape')
+
+def format_tree(tree, output_format):
+    """Formats the ASCII tree for a markdown or html output file."""
     if output_format == 'markdown':
-        with open(output_file_path, 'a', encoding='utf-8') as output_file:
-            output_file.write('## ASCII Tree of the Project Directory\n\n')
-            output_file.write('```\n')
-            output_file.write('\n'.join(tree))
-            output_file.write('\n```\n\n')
+        return '## ASCII Tree of the Project Directory\n\n```\n' + '\n'.join(tree) + '\n```\n\n'
     elif output_format == 'html':
-        with open(output_file_path, 'a', encoding='utf-8') as output_file:
-            output_file.write('<h2>ASCII Tree of the Project Directory</h2>\n<pre>\n')
-            output_file.write(html.escape('\n'.join(tree)))
-            output_file.write('\n</pre>\n')
-    elif output_format == 'json':
-        try:
-            with open(output_file_path, 'r+', encoding='utf-8') as output_file:
-                data = json.load(output_file)
-                data['ascii_tree'] = tree
-                output_file.seek(0)
-                json.dump(data, output_file, ensure_ascii=False, indent=4)
-        except json.JSONDecodeError:
-            with open(output_file_path, 'w', encoding='utf-8') as output_file:
-                data = {'ascii_tree': tree}
-                json.dump(data, output_file, ensure_ascii=False, indent=4)
-
-def write_explanation(output_file_path, output_format='markdown', markers=None):
-    """Writes an explanation of the file structure at the beginning of the output file."""
+        return '<h2>ASCII Tree of the Project Directory</h2>\n<pre>\n' + html.escape('\n'.join(tree)) + '\n</pre>\n'
+    return ''
+
+def format_explanation(output_format='markdown', markers=None):
+    """Returns the explanation of the file structure that starts each output file.
+
+    For json this is a dict, for the other formats a string.
+    """
     start_marker = markers.get('start', '=== Start of')
     end_marker = markers.get('end', '=== End of')
 
@@ -338,6 +1012,8 @@ Additional Information:
         explanation = {
             'description': 'Project Files Compilation',
             'details': 'This document contains the concatenated contents of project files.',
+            'format': 'JSON Lines: this object, then {"ascii_tree": [...]} in the first file, '
+                      'then one {"file", "metadata", "content"} object per file.',
             'structure_explanation': {
                 'Markers': [
                     f'{start_marker} relative/path/to/file {start_marker}: Indicates the beginning of a file\'s content.',
@@ -352,22 +1028,7 @@ Additional Information:
                 ]
             }
         }
-        with open(output_file_path, 'w', encoding='utf-8') as output_file:
-            json.dump(explanation, output_file, ensure_ascii=False, indent=4)
-        return
     else:
         explanation = ""
 
-    with open(output_file_path, 'w', encoding='utf-8') as output_file:
-        output_file.write(explanation)
-
-def count_tokens_in_file(file_path):
-    """Counts the number of tokens in the given file."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        tokens = content.split()
-        return len(tokens)
-    except Exception as e:
-        logging.error(f'Error counting tokens in {file_path}: {e}')
-        return 0
+    return explanation
@@ -1,34 +1,79 @@
 import os
+import re
+import bisect
 import sys
 import json
 import ast
 import threading
 import argparse
 import logging
+from collections import deque
 from typing import Dict, List, Tuple, Set
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
+from file_processor import worker_process_context
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Nodes that can hold statements; expressions never do, so they aren't descended into
+STATEMENT_CONTAINERS = (ast.stmt, ast.excepthandler) + ((ast.match_case,) if hasattr(ast, 'match_case') else ())
+
+# File types picked up for analysis and chunking
+ANALYZED_EXTENSIONS = ('.py', '.js', '.ts', '.jsx', '.tsx', '.css', '.html', '.md')
+
+# Files up to this size are read once, for both analysis and chunking, larger ones
+# aren't kept in between so the whole codebase is never held in memory
+CACHED_CONTENT_SIZE = 64 * 1024
+
+# ASCII letters, digits and whitespace, which estimate_tokens doesn't count as special
+PLAIN_ASCII_BYTES = bytes(i for i in range(128) if chr(i).isalnum() or chr(i).isspace())
+
+# Line patterns for fast analysis: from-imports (possibly parenthesized), plain imports,
+# and class and function definitions at any indentation
+IMPORT_RE = re.compile(r'^[ \t]*(?:from[ \t]+([.\w]+)[ \t]+import[ \t]+(?:\(([^)]*)\)|([^\n#;]+))|import[ \t]+([^\n#;]+))', re.M)
+CLASS_RE = re.compile(r'^[ \t]*class[ \t]+(\w+)', re.M)
+FUNCTION_RE = re.compile(r'^[ \t]*def[ \t]+(\w+)', re.M)
+
 class DependencyAnalyzer:
     """Analyzes Python files for imports and dependencies"""
     
-    def __init__(self):
+    def __init__(self, fast: bool = False):
+        # Scan the source with regexes instead of parsing it, see scan_source
+        self.fast = fast
         self.import_graph: Dict[str, Set[str]] = {}
         self.class_definitions: Dict[str, List[str]] = {}
         self.function_definitions: Dict[str, List[str]] = {}
         
-    def analyze_file(self, file_path: str) -> Tuple[Set[str], List[str], List[str]]:
-        """Analyze a single Python file for imports, classes, and functions"""
+    def analyze_file(self, file_path: str, source: bytes = None) -> Tuple[Set[str], List[str], List[str]]:
+        """Analyze a single Python file for imports, classes, and functions
+
+        The file is read unless its bytes are passed as source.
+        """
         imports = set()
         classes = []
         functions = []
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                tree = ast.parse(f.read(), filename=file_path)
+            if source is None:
+                with open(file_path, 'rb') as f:
+                    source = f.read()
+            if self.fast:
+                return self.scan_source(source.decode('utf-8'))
+            # Parsed as bytes, decoded by the file's coding declaration or UTF-8
+            tree = ast.parse(source, filename=file_path)
                 
-            for node in ast.walk(tree):
+            # Breadth first like ast.walk, so names come out in the same order,
+            # but only through statements, skipping the expression nodes
+            nodes = deque([tree])
+            while nodes:
+                node = nodes.popleft()
+                nodes.extend(child for child in ast.iter_child_nodes(node)
+                             if isinstance(child, STATEMENT_CONTAINERS))
                 if isinstance(node, ast.Import):
                     for name in node.names:
                         imports.add(name.name)
@@ -46,15 +91,33 @@ class DependencyAnalyzer:
             logging.error(f"Error analyzing file {file_path}: {str(e)}")
             return set(), [], []
 
+    @staticmethod
+    def scan_source(source: str) -> Tuple[Set[str], List[str], List[str]]:
+        """Extract imports, classes, and functions with line regexes, without building an AST.
+
+        Much faster than parsing, but approximate: lines inside strings can match,
+        backslash-continued imports are cut short, and names come in source order.
+        """
+        imports = set()
+        for module, grouped, names, plain in IMPORT_RE.findall(source):
+            if plain:
+                imports.update(name.split()[0] for name in plain.split(',') if name.strip())
+            else:
+                # Like ast's ImportFrom.module, relative imports drop their leading dots
+                module = module.lstrip('.')
+                imports.update(f"{module}.{name.split()[0]}" for name in (grouped or names).split(',')
+                               if name.strip())
+        return imports, CLASS_RE.findall(source), FUNCTION_RE.findall(source)
+
 class SmartFileProcessor:
-    def __init__(self, llm_name: str, codebase_path: str, output_dir: str):
+    def __init__(self, llm_name: str, codebase_path: str, output_dir: str, fast_analysis: bool = False):
         load_dotenv()
         self.llm_name = llm_name.lower()
         self.codebase_path = Path(codebase_path)
         self.output_dir = Path(output_dir)
         self.token_limit = self.get_token_limit()
         self.chunks: List[List[Tuple[str, str]]] = []
-        self.dependency_analyzer = DependencyAnalyzer()
+        self.dependency_analyzer = DependencyAnalyzer(fast=fast_analysis)
         self.file_metadata: Dict[str, dict] = {}
         
         # Create output directory immediately upon initialization
@@ -80,45 +143,45 @@ class SmartFileProcessor:
         """Analyze the codebase structure and dependencies"""
         logging.info("Starting codebase analysis...")
         
-        def process_file(file_path: Path) -> Tuple[Path, dict]:
-            relative_path = file_path.relative_to(self.codebase_path)
-            file_size = file_path.stat().st_size
-            
-            metadata = {
-                'size': file_size,
-                'relative_path': str(relative_path),
-                'extension': file_path.suffix,
-                'imports': [],
-                'classes': [],
-                'functions': []
-            }
-            
-            if file_path.suffix == '.py':
-                imports, classes, functions = self.dependency_analyzer.analyze_file(str(file_path))
-                metadata.update({
+        # Collect all files recursively, in a single walk for every extension
+        files = []
+        for root, _, names in os.walk(self.codebase_path):
+            files.extend(Path(root) / name for name in names if name.endswith(ANALYZED_EXTENSIONS))
+        
+        for file_path in files:
+            self.file_metadata[str(file_path)] = self.read_file_metadata(file_path)
+        
+        # Python files are parsed in worker processes, since parsing holds the GIL. Small
+        # files are sent the bytes already read here, larger ones are read by the worker
+        # and again when chunked, rather than kept. Workers send back only what they found
+        python_files = [str(file_path) for file_path in files if file_path.suffix == '.py']
+        sources = [self.file_metadata[file_path]['content'] for file_path in python_files]
+        chunksize = max(1, len(python_files) // ((os.cpu_count() or 1) * 4))
+        with ProcessPoolExecutor(mp_context=worker_process_context()) as executor:
+            analyses = executor.map(self.dependency_analyzer.analyze_file, python_files, sources, chunksize=chunksize)
+            for file_path, (imports, classes, functions) in zip(python_files, analyses):
+                self.file_metadata[file_path].update({
                     'imports': list(imports),
                     'classes': classes,
                     'functions': functions
                 })
-            
-            return file_path, metadata
-        
-        # Collect all files recursively
-        files = []
-        for ext in ['.py', '.js', '.ts', '.jsx', '.tsx', '.css', '.html', '.md']:
-            files.extend(self.codebase_path.rglob(f"*{ext}"))
-        
-        # Process files in parallel
-        with ThreadPoolExecutor() as executor:
-            results = list(executor.map(lambda f: process_file(f), files))
-        
-        # Store results
-        for file_path, metadata in results:
-            self.file_metadata[str(file_path)] = metadata
         
         # Generate summary
         self.generate_analysis_summary()
     
+    def read_file_metadata(self, file_path: Path) -> dict:
+        """Collect a file's metadata, keeping the content of small files for chunking"""
+        file_size = file_path.stat().st_size
+        return {
+            'size': file_size,
+            'content': file_path.read_bytes() if file_size <= CACHED_CONTENT_SIZE else None,
+            'relative_path': str(file_path.relative_to(self.codebase_path)),
+            'extension': file_path.suffix,
+            'imports': [],
+            'classes': [],
+            'functions': []
+        }
+    
     def generate_analysis_summary(self):
         """Generate a summary of the codebase analysis"""
         logging.info("Generating analysis summary...")
@@ -149,8 +212,12 @@ class SmartFileProcessor:
             
             # Save summary to JSON
             summary_path = self.output_dir / 'analysis_summary.json'
-            with open(summary_path, 'w', encoding='utf-8') as f:
-                json.dump(summary, f, indent=2)
+            if orjson is not None:
+                with open(summary_path, 'wb') as f:
+                    f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+            else:
+                with open(summary_path, 'w', encoding='utf-8') as f:
+                    json.dump(summary, f, indent=2)
             
             logging.info(f"Analysis summary saved to {summary_path}")
             
@@ -164,25 +231,26 @@ class SmartFileProcessor:
         # More accurate token estimation based on common tokenizer rules
         # This is a simplified version - production should use actual tokenizer
         words = content.split()
-        special_chars = sum(1 for c in content if not c.isalnum() and not c.isspace())
+        if content.isascii():
+            # Deleting the plain characters in C leaves exactly the special ones
+            special_chars = len(content.encode('ascii').translate(None, PLAIN_ASCII_BYTES))
+        else:
+            special_chars = sum(1 for c in content if not c.isalnum() and not c.isspace())
         return len(words) + (special_chars // 2)
     
     def split_into_chunks(self):
         """Split files into chunks based on token limit"""
         logging.info("Splitting files into chunks...")
         
-        current_chunk = []
-        current_tokens = 0
-        
-        # Sort files by size to optimize chunking
-        sorted_files = sorted(
-            self.file_metadata.items(),
-            key=lambda x: x[1]['size']
-        )
-        
-        for file_path, metadata in sorted_files:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+        files = []
+        for file_path, metadata in self.file_metadata.items():
+            # The bytes kept from analysis are only needed until they're decoded here
+            raw_content = metadata.pop('content', None)
+            if raw_content is None:
+                with open(file_path, 'rb') as f:
+                    raw_content = f.read()
+            # Newlines are translated like a text mode read would
+            content = raw_content.decode('utf-8', 'replace').replace('\r\n', '\n').replace('\r', '\n')
             
             tokens = self.estimate_tokens(content)
             
@@ -192,16 +260,21 @@ class SmartFileProcessor:
                 # Split into smaller chunks (implement based on specific needs)
                 continue
             
-            if current_tokens + tokens > self.token_limit:
-                self.chunks.append(current_chunk)
-                current_chunk = []
-                current_tokens = 0
-            
-            current_chunk.append((str(metadata['relative_path']), content))
-            current_tokens += tokens
+            files.append((tokens, str(metadata['relative_path']), content))
         
-        if current_chunk:
-            self.chunks.append(current_chunk)
+        # Largest files first, each into the fullest chunk that still has room for it
+        # (best fit decreasing), which needs far fewer chunks than filling them in order
+        files.sort(key=lambda f: f[0], reverse=True)
+        free_tokens = []  # (tokens left, chunk index), kept sorted
+        for tokens, relative_path, content in files:
+            i = bisect.bisect_left(free_tokens, (tokens, -1))
+            if i < len(free_tokens):
+                remaining, index = free_tokens.pop(i)
+            else:
+                remaining, index = self.token_limit, len(self.chunks)
+                self.chunks.append([])
+            self.chunks[index].append((relative_path, content))
+            bisect.insort(free_tokens, (remaining - tokens, index))
         
         logging.info(f"Created {len(self.chunks)} chunks")
     
@@ -260,10 +333,12 @@ def main():
     parser.add_argument('--llm', required=True, help='Target LLM name (e.g., gpt3, gpt4, claude)')
     parser.add_argument('--codebase', required=True, help='Path to the codebase directory')
     parser.add_argument('--output_dir', required=True, help='Directory to save the output files')
+    parser.add_argument('--fast_analysis', action='store_true',
+                        help='Find imports, classes and functions with regexes instead of parsing (approximate)')
     
     args = parser.parse_args()
     
-    processor = SmartFileProcessor(args.llm, args.codebase, args.output_dir)
+    processor = SmartFileProcessor(args.llm, args.codebase, args.output_dir, fast_analysis=args.fast_analysis)
     processor.process()
 
 if __name__ == "__main__":